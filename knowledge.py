@@ -18,7 +18,6 @@ from modules import (
     playlist,
     file_converter
 )
-from transformers import GPT2Tokenizer
 
 def load_config():
     config_file = "settings.json"
@@ -31,7 +30,8 @@ def load_config():
         config = {
             "download_folder": os.path.join(os.getcwd(), "Transcriptions"),
             "model_path": os.path.join(os.getcwd(), "models"),  # Path for saving model weights
-            "qdrant_path": os.path.join(os.getcwd(), "qdrant_data")  # Path for Qdrant storage
+            "qdrant_path": os.path.join(os.getcwd(), "qdrant_data"),  # Path for Qdrant storage
+            "cache_path": os.path.join(os.getcwd(), "embed_cache")  # Path for cached chunk embeddings
         }
         with open(config_file, 'w') as f:
             json.dump(config, f)
@@ -80,16 +80,6 @@ def main():
     global config
     config = load_config()
 
-    # Initialize tokenizer
-    tokenizer = GPT2Tokenizer.from_pretrained('gpt2')
-
-    # Ensure tokenizer has a padding token and eos token
-    if tokenizer.pad_token is None:
-        if tokenizer.eos_token is None:
-            tokenizer.add_special_tokens({'pad_token': '[PAD]', 'eos_token': '[EOS]'})
-        else:
-            tokenizer.pad_token = tokenizer.eos_token
-
     # Main content area
     tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
         "Chat",  # New chat tab
@@ -39,7 +39,7 @@ class CausalSelfAttention(nn.Module):
             self.register_buffer("bias", torch.tril(torch.ones(config.block_size, config.block_size))
                                         .view(1, 1, config.block_size, config.block_size))
 
-    def forward(self, x):
+    def forward(self, x, past_kv=None, use_cache=False):
         B, T, C = x.size() # batch size, sequence length, embedding dimensionality (n_embd)
 
         # calculate query, key, values for all heads in batch and move head forward to be the batch dim
@@ -48,14 +48,29 @@ class CausalSelfAttention(nn.Module):
         q = q.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
         v = v.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
 
+        # with a kv cache the new queries attend over the cached keys/values plus their own
+        T_past = 0
+        if past_kv is not None:
+            past_k, past_v = past_kv
+            T_past = past_k.size(2)
+            k = torch.cat((past_k, k), dim=2) # (B, nh, T_past + T, hs)
+            v = torch.cat((past_v, v), dim=2)
+        present = (k, v) if use_cache else None
+
         # causal self-attention; Self-attend: (B, nh, T, hs) x (B, nh, hs, T) -> (B, nh, T, T)
         if self.flash:
             # efficient attention using Flash Attention CUDA kernels
-            y = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=None, dropout_p=self.dropout if self.training else 0, is_causal=True)
+            if T_past == 0:
+                y = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=None, dropout_p=self.dropout if self.training else 0, is_causal=True)
+            else:
+                # is_causal aligns the mask top-left, so give the cached case an explicit one
+                # (a single new token may simply attend to everything)
+                attn_mask = None if T == 1 else torch.ones(T, T_past + T, dtype=torch.bool, device=x.device).tril(diagonal=T_past)
+                y = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, dropout_p=self.dropout if self.training else 0)
         else:
             # manual implementation of attention
             att = (q @ k.transpose(-2, -1)) * (1.0 / math.sqrt(k.size(-1)))
-            att = att.masked_fill(self.bias[:,:,:T,:T] == 0, float('-inf'))
+            att = att.masked_fill(self.bias[:,:,T_past:T_past+T,:T_past+T] == 0, float('-inf'))
             att = F.softmax(att, dim=-1)
             att = self.attn_dropout(att)
             y = att @ v # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
@@ -63,6 +78,8 @@ class CausalSelfAttention(nn.Module):
 
         # output projection
         y = self.resid_dropout(self.c_proj(y))
+        if use_cache:
+            return y, present
         return y
 
 class MLP(nn.Module):
@@ -90,7 +107,12 @@ class Block(nn.Module):
         self.ln_2 = LayerNorm(config.n_embd, bias=config.bias)
         self.mlp = MLP(config)
 
-    def forward(self, x):
+    def forward(self, x, past_kv=None, use_cache=False):
+        if use_cache:
+            attn_out, present = self.attn(self.ln_1(x), past_kv=past_kv, use_cache=True)
+            x = x + attn_out
+            x = x + self.mlp(self.ln_2(x))
+            return x, present
         x = x + self.attn(self.ln_1(x))
         x = x + self.mlp(self.ln_2(x))
         return x
@@ -157,18 +179,28 @@ class GPT(nn.Module):
         elif isinstance(module, nn.Embedding):
             torch.nn.init.normal_(module.weight, mean=0.0, std=0.02)
 
-    def forward(self, idx, targets=None):
+    def forward(self, idx, targets=None, past_kv=None, use_cache=False):
+        """
+        With use_cache=True also returns the per-layer (k, v) tensors so that a following
+        call can pass them as past_kv and only forward the newly appended tokens.
+        """
         device = idx.device
         b, t = idx.size()
-        assert t <= self.config.block_size, f"Cannot forward sequence of length {t}, block size is only {self.config.block_size}"
-        pos = torch.arange(0, t, dtype=torch.long, device=device) # shape (t)
+        t_past = past_kv[0][0].size(2) if past_kv is not None else 0
+        assert t_past + t <= self.config.block_size, f"Cannot forward sequence of length {t_past + t}, block size is only {self.config.block_size}"
+        pos = torch.arange(t_past, t_past + t, dtype=torch.long, device=device) # shape (t)
 
         # forward the GPT model itself
         tok_emb = self.transformer.wte(idx) # token embeddings of shape (b, t, n_embd)
         pos_emb = self.transformer.wpe(pos) # position embeddings of shape (t, n_embd)
         x = self.transformer.drop(tok_emb + pos_emb)
-        for block in self.transformer.h:
-            x = block(x)
+        presents = [] if use_cache else None
+        for i, block in enumerate(self.transformer.h):
+            if use_cache:
+                x, present = block(x, past_kv=past_kv[i] if past_kv is not None else None, use_cache=True)
+                presents.append(present)
+            else:
+                x = block(x)
         x = self.transformer.ln_f(x)
 
         if targets is not None:
@@ -180,6 +212,8 @@ class GPT(nn.Module):
             logits = self.lm_head(x[:, [-1], :]) # note: using list [-1] to preserve the time dim
             loss = None
 
+        if use_cache:
+            return logits, loss, presents
         return logits, loss
 
     def crop_block_size(self, block_size):
@@ -298,12 +332,18 @@ class GPT(nn.Module):
         Take a conditioning sequence of indices idx (LongTensor of shape (b,t)) and complete
         the sequence max_new_tokens times, feeding the predictions back into the model each time.
         Most likely you'll want to make sure to be in model.eval() mode of operation for this.
+        Keys/values are cached across steps, so each new token costs one single-token forward.
         """
+        past_kv = None
         for _ in range(max_new_tokens):
-            # if the sequence context is growing too long we must crop it at block_size
-            idx_cond = idx if idx.size(1) <= self.config.block_size else idx[:, -self.config.block_size:]
-            # forward the model to get the logits for the index in the sequence
-            logits, _ = self(idx_cond)
+            if past_kv is not None and idx.size(1) <= self.config.block_size:
+                # the cache holds keys/values for all but the newest token, so only forward that one
+                logits, _, past_kv = self(idx[:, -1:], past_kv=past_kv, use_cache=True)
+            else:
+                # first step, or the context outgrew block_size: crop it and prefill from scratch
+                # (cropping shifts every position, so cached keys/values no longer line up)
+                idx_cond = idx if idx.size(1) <= self.config.block_size else idx[:, -self.config.block_size:]
+                logits, _, past_kv = self(idx_cond, use_cache=True)
             # pluck the logits at the final step and scale by desired temperature
             logits = logits[:, -1, :] / temperature
             # optionally crop the logits to only the top k options
@@ -8,10 +8,12 @@ import time
 import re
 import os
 
+SHORTS_CHANNEL_NAME_RE = re.compile(r"youtube\.com/@?([^/?#]+)/shorts")
+
 
 def get_channel_name_from_shorts_url(shorts_url):
     """Extract channel name from shorts URL."""
-    match = re.search(r"youtube\.com/[@]?([^/]+)/shorts", shorts_url)
+    match = SHORTS_CHANNEL_NAME_RE.search(shorts_url)
     if match:
         return match.group(1)
     else:
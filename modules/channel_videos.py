@@ -3,10 +3,10 @@ import pandas as pd
 from utils.logging_setup import logger
 from utils.common import (
     get_video_id_from_url,
-    get_video_title,
-    fetch_transcript,
+    fetch_transcript_or_error,
     save_transcript_to_text,
-    create_folder
+    create_folder,
+    MAX_TRANSCRIPT_WORKERS
 )
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -15,10 +15,14 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
+from yt_dlp import YoutubeDL
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import re
 import os
 
+CHANNEL_NAME_RE = re.compile(r'youtube\.com/@?([^/?#]+)')
+
 
 def setup_chrome_driver():
     """Setup Chrome WebDriver with proper configuration."""
@@ -53,7 +57,7 @@ def setup_chrome_driver():
 
 def get_channel_name_from_url(channel_url):
     """Extract channel name from URL."""
-    match = re.search(r'youtube\.com/[@]?([^/]+)/?', channel_url)
+    match = CHANNEL_NAME_RE.search(channel_url)
     if match:
         channel_name = match.group(1)
         logger.info(f"Extracted channel name from URL: {channel_name}")
@@ -63,6 +67,33 @@ def get_channel_name_from_url(channel_url):
         return None
 
 
+def fetch_videos_from_channel_ytdlp(channel_url):
+    """Fetch videos from channel with a flat yt-dlp listing (no browser needed)."""
+    # The channel root lists its tabs; the videos tab lists the uploads themselves
+    videos_url = channel_url.split('?')[0].rstrip('/')
+    if not videos_url.endswith('/videos'):
+        videos_url += '/videos'
+
+    logger.info(f"Listing channel videos with yt-dlp: {videos_url}")
+    with YoutubeDL({'extract_flat': True, 'quiet': True, 'no_warnings': True}) as ydl:
+        info = ydl.extract_info(videos_url, download=False)
+
+    videos_data = []
+    seen = set()  # URLs already listed; a list scan per entry is quadratic on big channels
+    for entry in info.get('entries') or []:
+        if not entry or not entry.get('id') or not entry.get('title'):
+            continue
+        video_url = f"https://www.youtube.com/watch?v={entry['id']}"
+        if video_url in seen:
+            continue
+        seen.add(video_url)
+        sanitized_title = re.sub(r'[\\/*?:"<>|]', '', entry['title'])
+        videos_data.append((video_url, sanitized_title))
+
+    logger.info(f"Found total of {len(videos_data)} videos")
+    return videos_data
+
+
 def fetch_videos_from_channel_selenium(channel_url):
     """Fetch videos from channel using Selenium with Chrome."""
     driver = None
@@ -73,20 +104,26 @@ def fetch_videos_from_channel_selenium(channel_url):
 
         logger.info(f"Loading channel URL: {channel_url}")
         driver.get(channel_url)
-        time.sleep(5)
+        try:
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "a#video-title-link")))
+        except TimeoutException:
+            logger.warning("Timed out waiting for the first videos to render")
 
         # Scroll with timeout
         scroll_timeout = 120  # 2 minutes
-        scroll_pause_time = 2
+        scroll_poll_timeout = 5  # Max wait for new content after each scroll
         scroll_start_time = time.time()
 
         last_height = driver.execute_script("return document.documentElement.scrollHeight")
         while True:
             driver.execute_script("window.scrollTo(0, document.documentElement.scrollHeight);")
-            time.sleep(scroll_pause_time)
 
-            new_height = driver.execute_script("return document.documentElement.scrollHeight")
-            if new_height == last_height:
+            # Continue as soon as the page grows instead of sleeping a fixed interval
+            try:
+                WebDriverWait(driver, scroll_poll_timeout).until(
+                    lambda d: d.execute_script("return document.documentElement.scrollHeight") > last_height
+                )
+            except TimeoutException:
                 logger.info("Reached end of channel page")
                 break
 
@@ -94,7 +131,7 @@ def fetch_videos_from_channel_selenium(channel_url):
                 logger.warning("Scroll timeout reached")
                 break
 
-            last_height = new_height
+            last_height = driver.execute_script("return document.documentElement.scrollHeight")
 
         # Try multiple selectors for video elements
         video_selectors = [
@@ -175,7 +212,13 @@ def render(config):
                     folder_name = os.path.join(config['download_folder'], channel_name)
                     create_folder(folder_name)
 
-                    videos_data = fetch_videos_from_channel_selenium(channel_url)
+                    try:
+                        videos_data = fetch_videos_from_channel_ytdlp(channel_url)
+                    except Exception as e:
+                        logger.warning(f"yt-dlp listing failed, falling back to Selenium: {str(e)}")
+                        videos_data = []
+                    if not videos_data:
+                        videos_data = fetch_videos_from_channel_selenium(channel_url)
 
                     if videos_data:
                         status_placeholder.success(f"Found {len(videos_data)} videos")
@@ -216,28 +259,36 @@ def render(config):
             folder_name = st.session_state['folder_name']
             progress_bar = st.progress(0)
 
-            for i, video in enumerate(video_list):
-                try:
-                    video_url = videos_data[i][0]
-                    transcript = fetch_transcript(video_url)
-                    if transcript:
-                        filename = get_video_title(video_url)
-                        save_path = save_transcript_to_text(transcript, filename, folder_name)
-                        if save_path:
-                            video['Downloaded'] = '✅'
+            # Transcript requests are network-bound and independent, so fetch them concurrently.
+            # Workers only fetch; errors are reported and files written here on the script
+            # thread, named after the titles already in the channel listing.
+            with ThreadPoolExecutor(max_workers=MAX_TRANSCRIPT_WORKERS) as executor:
+                futures = {
+                    executor.submit(fetch_transcript_or_error, video_url): (video, filename)
+                    for (video_url, filename), video in zip(videos_data, video_list)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    video, filename = futures[future]
+                    try:
+                        transcript, error = future.result()
+                        if error:
+                            st.error(error)
+                        if transcript:
+                            save_path = save_transcript_to_text(transcript, filename, folder_name)
+                            if save_path:
+                                video['Downloaded'] = '✅'
+                            else:
+                                video['Downloaded'] = '❌'
                         else:
                             video['Downloaded'] = '❌'
-                    else:
+
+                    except Exception as e:
+                        logger.error(f"Error downloading transcript for video {video['Video Title']}: {str(e)}")
                         video['Downloaded'] = '❌'
 
                     df = pd.DataFrame(video_list)
                     table_placeholder.table(df)
-                    progress_bar.progress((i + 1) / len(video_list))
-
-                except Exception as e:
-                    logger.error(f"Error downloading transcript for video {video['Video Title']}: {str(e)}")
-                    video['Downloaded'] = '❌'
-                    continue
+                    progress_bar.progress(done / len(video_list))
 
             successful = sum(1 for v in video_list if v['Downloaded'] == '✅')
             st.success(f"Successfully downloaded {successful} out of {len(video_list)} transcripts to {folder_name}")
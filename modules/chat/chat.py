@@ -3,227 +3,484 @@ import os
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from utils.logging_setup import logger
-from typing import List, Dict, Optional
-import glob
+from utils.embed_cache import (
+    get_embed_cache, chunk_hash, get_file_chunks, set_file_chunks, get_last_ingest, set_last_ingest
+)
+from typing import List, Dict, Optional, Tuple, Iterator
+import time
+import functools
+from collections import deque
+import uuid
+import threading
 import traceback
-from sentence_transformers import SentenceTransformer
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 import torch
 from torch import Tensor
-
-# Initialize models globally
-MINILM_MODEL = None
-
-
-def get_minilm_model():
-    global MINILM_MODEL
-    if MINILM_MODEL is None:
-        MINILM_MODEL = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    return MINILM_MODEL
-
-
-def test_embeddings():
-    """Test function to verify embeddings are working"""
+# Models, tokenizer and the Ollama session are shared with ChatUI so they load only once
+from .embeddings import (
+    DEVICE,
+    MINILM_MAX_SEQ_LENGTH,
+    get_minilm_model,
+    get_minilm_tokenizer,
+    get_onnx_session,
+    onnx_embed_ids,
+    embed_model_version,
+    get_embeddings,
+    test_embeddings,
+    set_model_path
+)
+from .llm import generate_with_phi, stream_with_phi, PhiError
+from .utils import get_transcript_files
+
+
+INGEST_WORKERS = 4
+UPSERT_BATCH_SIZE = 256
+EMBED_FLUSH_SIZE = 512
+READ_BLOCK_SIZE = 256 * 1024  # Characters per transcript read
+HNSW_M = 16
+QUERY_CACHE_SIZE = 512
+MAX_CHAT_HISTORY = 50
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "knowledge/transcripts")
+
+# Bumped after every ingest that stores points, so cached retrievals never outlive the corpus
+_corpus_version = 0
+
+
+# The compiled encoder and the Qdrant client are process-wide singletons shared by
+# every Streamlit session and rerun
+@st.cache_resource(show_spinner=False)
+def get_minilm_transformer():
+    """The MiniLM encoder compiled with torch.compile for batched ingest, or eager if that fails"""
+    transformer = get_minilm_model()[0].auto_model
     try:
-        logger.info("Starting embeddings test...")
-
-        # Test model loading
-        model = get_minilm_model()
-        logger.info("Model loaded successfully")
-
-        # Test basic encoding
-        test_text = "This is a test sentence."
-        logger.info(f"Testing encoding of: {test_text}")
-
-        embeddings = get_embeddings(test_text)
-        if embeddings is not None:
-            logger.info(f"Test embeddings length: {len(embeddings)}")
-            return True
-
-        logger.error("Embeddings are None")
-        return False
-
+        # Batch widths vary with smart batching, so compile one dynamic-shape graph
+        compiled = torch.compile(
+            transformer, dynamic=True, mode="reduce-overhead" if DEVICE == "cuda" else "default"
+        )
+        # Compilation happens on the first call; run it here so failures fall back cleanly
+        dummy = torch.ones((1, 8), dtype=torch.long, device=DEVICE)
+        with torch.inference_mode(), torch.autocast(
+                device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == "cuda"):
+            compiled(input_ids=dummy, attention_mask=dummy)
+        logger.info("Compiled MiniLM encoder with torch.compile")
+        return compiled
     except Exception as e:
-        logger.error(f"Test embeddings failed: {str(e)}")
-        logger.error(traceback.format_exc())
-        return False
+        logger.warning(f"torch.compile unavailable, using eager MiniLM: {str(e)}")
+        return transformer
 
 
-def setup_qdrant(config):
-    """Initialize Qdrant client"""
-    try:
-        qdrant_path = config['qdrant_path']
-        os.makedirs(qdrant_path, exist_ok=True)
+def _fix_qdrant_permissions(qdrant_path: str):
+    """Make every file and directory in the Qdrant storage writable"""
+    os.chmod(qdrant_path, 0o777)
+    for root, dirs, files in os.walk(qdrant_path):
+        for d in dirs:
+            os.chmod(os.path.join(root, d), 0o777)
+        for f in files:
+            os.chmod(os.path.join(root, f), 0o666)
+    logger.info("Fixed Qdrant storage permissions")
 
-        # Remove lock file if it exists
-        lock_file = os.path.join(qdrant_path, '.lock')
-        if os.path.exists(lock_file):
-            os.remove(lock_file)
-            logger.info("Removed existing Qdrant lock file")
 
-        # Set permissions
+@st.cache_resource(show_spinner=False)
+def _open_qdrant(qdrant_path: str, fix_permissions: bool = False) -> QdrantClient:
+    if not os.path.exists(qdrant_path):
+        os.makedirs(qdrant_path)
         os.chmod(qdrant_path, 0o777)
-        for root, dirs, files in os.walk(qdrant_path):
-            for d in dirs:
-                os.chmod(os.path.join(root, d), 0o777)
-            for f in files:
-                os.chmod(os.path.join(root, f), 0o666)
-
-        client = QdrantClient(path=qdrant_path)
-        # Using MiniLM embedding size (384)
-        client.recreate_collection(
-            collection_name="transcripts",
-            vectors_config=models.VectorParams(
-                size=384,
-                distance=models.Distance.COSINE
+
+    # Remove lock file if it exists
+    lock_file = os.path.join(qdrant_path, '.lock')
+    if os.path.exists(lock_file):
+        os.remove(lock_file)
+        logger.info("Removed existing Qdrant lock file")
+
+    # Walking every storage file is only worth it when recovering from bad permissions
+    if fix_permissions:
+        _fix_qdrant_permissions(qdrant_path)
+
+    # The one client is shared across sessions, whose reruns happen on different threads
+    client = QdrantClient(path=qdrant_path, force_disable_check_same_thread=True)
+    _ensure_collection(client)
+    return client
+
+
+@st.cache_resource(show_spinner=False)
+def _connect_qdrant(qdrant_url: str) -> QdrantClient:
+    # A Qdrant server takes vectors over gRPC, whose binary framing is much lighter than JSON
+    client = QdrantClient(url=qdrant_url, prefer_grpc=True, grpc_port=6334)
+    _ensure_collection(client)
+    return client
+
+
+def _ensure_collection(client: QdrantClient):
+    """Create the transcripts collection unless a compatible one already exists"""
+    # Point ids are stable across runs, so keep what was ingested before and let
+    # re-ingest overwrite it in place instead of wiping the collection every session
+    if client.collection_exists("transcripts"):
+        params = client.get_collection("transcripts").config.params
+        if params.vectors.distance == models.Distance.DOT:
+            return
+        # Distance can't be changed in place; the embedding cache makes the re-ingest cheap
+        logger.info("Recreating transcripts collection with dot-product distance")
+        client.delete_collection("transcripts")
+
+    # Using MiniLM embedding size (384)
+    client.create_collection(
+        collection_name="transcripts",
+        vectors_config=models.VectorParams(
+            size=384,
+            distance=models.Distance.DOT,  # Vectors are stored unit-length, so dot == cosine
+            on_disk=True  # Originals stay on disk, quantized copies live in RAM
+        ),
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
             )
         )
-        return client
-    except Exception as e:
-        logger.error(f"Error setting up Qdrant: {str(e)}")
-        logger.error(traceback.format_exc())
-        return None
+    )
 
 
-def get_embeddings(text: str) -> List[float]:
-    """Get embeddings using MiniLM model"""
+def setup_qdrant(config):
+    """Initialize Qdrant client"""
     try:
-        model = get_minilm_model()
-        logger.info("Model loaded successfully")
-
-        # Generate embeddings
-        with torch.no_grad():
-            embeddings = model.encode(
-                text,
-                convert_to_tensor=True,
-                show_progress_bar=False
-            )
-            logger.info(f"Generated embeddings type: {type(embeddings)}")
-
-            # Convert tensor to list directly without numpy
-            if isinstance(embeddings, torch.Tensor):
-                embeddings = embeddings.tolist()
-                logger.info("Converted tensor to list successfully")
-                return embeddings
-
-            # If already a list or numpy array
-            if hasattr(embeddings, 'tolist'):
-                return embeddings.tolist()
-
-            return list(embeddings)
-
+        # Failures raise out of the cached openers, so they are retried on the next call
+        if config.get('qdrant_url'):
+            return _connect_qdrant(config['qdrant_url'])
+        return _open_qdrant(config['qdrant_path'], config.get('fix_permissions', False))
     except Exception as e:
-        logger.error(f"Error getting embeddings: {str(e)}")
+        logger.error(f"Error setting up Qdrant: {str(e)}")
         logger.error(traceback.format_exc())
         return None
 
 
-def generate_with_phi(prompt: str, max_tokens: int = 150, temperature: float = 0.7) -> str:
-    """Generate response using Phi model"""
-    try:
-        url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": "phi3:3.8b",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens,
-                "num_ctx": 512,
-                "num_thread": 4
-            }
-        }
-
+def _stream_token_windows(f, tokenizer, window: int, stride: int,
+                          read_size: int = READ_BLOCK_SIZE) -> Iterator[Tuple[Tensor, str]]:
+    """Tokenize a text file block by block, yielding overlapping fixed-size id windows
+    and their source text as soon as each window is complete.
+
+    Blocks are cut at whitespace, which the WordPiece pre-tokenizer splits on anyway,
+    so the ids match tokenizing the whole file at once. Only the tokens and text still
+    needed for upcoming windows are kept, not the whole file.
+    """
+    ids, offsets = [], []  # Tokens from global index base onwards, offsets in global chars
+    base = 0
+    text, text_start = "", 0  # Source text from global char text_start onwards
+    next_start = 0  # Global token index of the next window to emit
+    emitted = False
+    carry = ""
+
+    def make_window(start, end):
+        first, last = start - base, end - base
+        chunk_text = text[offsets[first][0] - text_start:offsets[last - 1][1] - text_start]
+        return torch.tensor(ids[first:last], dtype=torch.long), chunk_text
+
+    while True:
+        block = f.read(read_size)
+        segment = carry + block
+        if block:
+            # Hold back the trailing partial word so no token straddles two blocks
+            cut = max(segment.rfind(" "), segment.rfind("\n"), segment.rfind("\t")) + 1
+            segment, carry = segment[:cut], segment[cut:]
+        else:
+            carry = ""
+
+        if segment:
+            segment_start = text_start + len(text)
+            text += segment
+            encoding = tokenizer(segment, add_special_tokens=False, return_offsets_mapping=True)
+            ids.extend(encoding['input_ids'])
+            offsets.extend((segment_start + s, segment_start + e) for s, e in encoding['offset_mapping'])
+
+        while next_start + window <= base + len(ids):
+            yield make_window(next_start, next_start + window)
+            emitted = True
+            next_start += stride
+            # The tail window at EOF may reach back to just after the last emitted start
+            keep = next_start - stride
+            if keep > base:
+                del ids[:keep - base], offsets[:keep - base]
+                base = keep
+                text, text_start = text[offsets[0][0] - text_start:], offsets[0][0]
+
+        if not block:
+            break
+
+    total = base + len(ids)
+    if not emitted:
+        if total:
+            yield make_window(base, total)
+    elif next_start - stride + window < total:
+        # A trailing remainder that does not fill a whole window gets one last full window
+        yield make_window(total - window, total)
+
+
+def _encode_ids(input_ids: Tensor, attention_mask: Tensor) -> Tensor:
+    """Mean-pooled, L2-normalized MiniLM embeddings for a batch of token ids"""
+    with torch.inference_mode():
+        session = get_onnx_session()
+        if session is not None:
+            # Same ONNX run and pooling as ChatUI, so both fill the shared cache with equal vectors
+            return torch.from_numpy(onnx_embed_ids(session, input_ids.numpy(), attention_mask.numpy()))
+
+        transformer = get_minilm_transformer()
+        input_ids = input_ids.to(DEVICE)
+        attention_mask = attention_mask.to(DEVICE)
+        with torch.autocast(device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == "cuda"):
+            hidden = transformer(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled.float(), dim=1).cpu()
+
+
+def _embed_token_windows(windows: List[Tensor], batch_size: int = 64) -> np.ndarray:
+    """Run MiniLM directly on pre-tokenized windows and mean-pool to sentence embeddings.
+
+    Windows are sorted by length so every mini-batch only pads to its own longest
+    window ("smart batching"); results come back as float32 rows in the original order.
+    """
+    tokenizer = get_minilm_tokenizer()
+    order = sorted(range(len(windows)), key=lambda i: windows[i].numel())
+    embeddings = np.empty((len(windows), 384), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        width = windows[batch[-1]].numel() + 2
+        input_ids = torch.full((len(batch), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+
+        # Wrap every window in [CLS] ... [SEP] like the tokenizer would
+        for row, i in enumerate(batch):
+            length = windows[i].numel()
+            input_ids[row, 0] = tokenizer.cls_token_id
+            input_ids[row, 1:length + 1] = windows[i]
+            input_ids[row, length + 1] = tokenizer.sep_token_id
+            attention_mask[row, :length + 2] = 1
+
+        embeddings[batch] = _encode_ids(input_ids, attention_mask).numpy()
+
+    return embeddings
+
+
+def _point_id(file_path: str, chunk_index: int) -> str:
+    """Deterministic UUIDv5 point id; unlike hash() it is the same in every process"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{file_path}:{chunk_index}"))
+
+
+def _iter_transcripts(root: str, since_ts: float) -> Iterator[str]:
+    """Yield the transcripts under root modified after since_ts"""
+    for file_path in get_transcript_files(root):
         try:
-            response = requests.post(url, json=payload, timeout=90)  # Increased timeout
-
-            if response.status_code == 200:
-                result = response.json()
-                if 'response' in result:
-                    return result['response']
-                else:
-                    logger.error(f"Unexpected response format: {result}")
-                    return "Error: Unexpected response format from model."
-
-            # Handle specific error codes
-            error_messages = {
-                408: "Request timed out. Try a shorter prompt.",
-                500: "Server error. The model might be overloaded.",
-                503: "Service unavailable. Please try again in a moment."
-            }
-            error_msg = error_messages.get(response.status_code, f"Error {response.status_code} from API")
-            logger.error(f"{error_msg}: {response.text}")
-            return error_msg
-
-        except requests.exceptions.Timeout:
-            logger.error("Request timed out")
-            return "The request took too long to process. Please try again."
-        except requests.exceptions.ConnectionError:
-            logger.error("Connection failed")
-            return "Could not connect to the model service. Is it running?"
-
-    except Exception as e:
-        logger.error(f"Error generating with Phi: {str(e)}")
+            modified = os.path.getmtime(file_path)
+        except OSError as e:
+            # e.g. a dangling symlink; the rest of the tree still gets ingested
+            logger.warning(f"Skipping {file_path}: {str(e)}")
+            continue
+        if modified > since_ts:
+            yield file_path
+
+
+def _prepare_file(file_path: str, cache, model_version: str, progress_lock: threading.Lock):
+    """Read and chunk a single transcript file, filling in embeddings from the cache.
+
+    Returns (chunks, embeddings, missing) where embeddings is None for every chunk
+    index listed in missing, paired with the token window that still needs the model.
+    """
+    with progress_lock:
+        logger.info(f"Processing file: {file_path}")
+
+    # Unchanged files reuse their recorded chunks and skip tokenization entirely
+    chunks = get_file_chunks(cache, file_path)
+    if chunks is not None:
+        embeddings = [cache.get(chunk_hash(chunk_text, model_version)) for chunk_text in chunks]
+        if all(vector is not None for vector in embeddings):
+            return chunks, embeddings, []
+        # Some vectors were evicted, rebuild the file
+
+    # Split into overlapping token windows sized to what MiniLM actually reads
+    # (its sequence limit minus [CLS]/[SEP]), so nothing is silently truncated.
+    # Only chunks whose content has not been embedded before keep their ids for the model
+    tokenizer = get_minilm_tokenizer()
+    window = MINILM_MAX_SEQ_LENGTH - 2
+    chunks, embeddings, missing = [], [], []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for i, (window_ids, chunk_text) in enumerate(_stream_token_windows(f, tokenizer, window, window // 2)):
+            vector = cache.get(chunk_hash(chunk_text, model_version))
+            chunks.append(chunk_text)
+            embeddings.append(vector)
+            if vector is None:
+                missing.append((i, window_ids))
+
+    if chunks:
+        set_file_chunks(cache, file_path, chunks)
+    return chunks, embeddings, missing
+
+
+def _embed_pending(pending, prepared, cache, model_version: str):
+    """Embed uncached windows and fill them into their files' embeddings and the cache"""
+    if not pending:
+        return
+    logger.info(f"Embedding {len(pending)} new chunks")
+    vectors = _embed_token_windows([window for _, _, window in pending])
+    for (file_index, i, _), vector in zip(pending, vectors):
+        _, chunks, embeddings = prepared[file_index]
+        embeddings[i] = vector
+        cache.set(chunk_hash(chunks[i], model_version), vector)
+
+
+def _log_ingest_error(message: str, error: Exception, logged_errors: set):
+    """Log an ingest failure in one line, with the traceback only for the first of its kind.
+
+    A systemic failure (model OOM, Qdrant down) otherwise writes the same traceback
+    for every file and batch.
+    """
+    logger.error(f"{message}: {str(error)}")
+    if type(error) not in logged_errors:
+        logged_errors.add(type(error))
         logger.error(traceback.format_exc())
-        return f"Error: {str(e)}"
+
 
 def ingest_transcripts(client: QdrantClient, config: Dict) -> bool:
     """Ingest transcripts into Qdrant"""
+    global _corpus_version
     try:
         if client is None:
             logger.error("Qdrant client is not initialized")
             return False
 
-        transcript_files = glob.glob(os.path.join(config['download_folder'], '**/*.txt'), recursive=True)
-        logger.info(f"Found {len(transcript_files)} transcript files to process")
-
-        for file_path in transcript_files:
+        # Load the model and cache once up front so the workers don't race to initialize them
+        get_minilm_tokenizer()
+        if get_onnx_session() is None:
+            get_minilm_transformer()
+        cache = get_embed_cache(config.get('cache_path', os.path.join(os.getcwd(), 'embed_cache')))
+        model_version = embed_model_version()
+
+        # Files untouched since the last complete ingest are already stored, so skip them at the
+        # directory scan. An empty collection (new or recreated) always gets everything
+        download_folder = config['download_folder']
+        if not os.path.isdir(download_folder):
+            logger.warning(f"Transcript folder {download_folder} does not exist yet")
+            return True
+        ingest_started = time.time()
+        initial_load = client.count("transcripts").count == 0
+        since_ts = 0.0 if initial_load else get_last_ingest(cache, download_folder)
+        logger.info(f"Ingesting transcripts modified since {time.ctime(since_ts)}")
+        failed_files, failed_points = 0, 0
+        logged_errors = set()
+
+        # Workers read, tokenize and check the cache a bounded number of files ahead while
+        # this thread embeds whatever they have produced so far, so the stages overlap
+        progress_lock = threading.Lock()
+        prepared = []  # (file_path, chunks, embeddings)
+        pending = []  # (index into prepared, chunk index, token window)
+        files = _iter_transcripts(download_folder, since_ts)
+        with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as executor:
+            in_flight = {}
+
+            def submit_next():
+                file_path = next(files, None)
+                if file_path is not None:
+                    future = executor.submit(_prepare_file, file_path, cache, model_version, progress_lock)
+                    in_flight[future] = file_path
+
+            for _ in range(INGEST_WORKERS * 2):
+                submit_next()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        chunks, embeddings, missing = future.result()
+                    except Exception as file_error:
+                        failed_files += 1
+                        _log_ingest_error(f"Error processing file {file_path}", file_error, logged_errors)
+                        continue
+                    pending.extend((len(prepared), i, window) for i, window in missing)
+                    prepared.append((file_path, chunks, embeddings))
+
+                # Windows from many files accumulate first so short transcripts still
+                # share length-sorted batches instead of each running as a batch of one
+                if len(pending) >= EMBED_FLUSH_SIZE:
+                    _embed_pending(pending, prepared, cache, model_version)
+                    pending = []
+
+        _embed_pending(pending, prepared, cache, model_version)
+
+        # The embedded Qdrant client is bound to this thread, so upsert here, in fixed-size
+        # batches that span files rather than one request per (often tiny) file
+        # Keep the vectors in one contiguous float32 matrix and only turn each upsert
+        # batch into lists at the last moment
+        ids, payloads, vectors = [], [], []
+        for file_path, chunks, embeddings in prepared:
+            for i, (chunk_text, vector) in enumerate(zip(chunks, embeddings)):
+                ids.append(_point_id(file_path, i))
+                payloads.append({"text": chunk_text, "source": file_path})
+                vectors.append(vector)
+        if prepared and not initial_load:
+            # Changed files may already have chunks stored; drop them so chunks past the end
+            # of a now shorter file don't linger next to the new ones
             try:
-                logger.info(f"Processing file: {file_path}")
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-
-                # Split text into chunks (300 words with 50 word overlap)
-                words = text.split()
-                chunk_size = 300
-                overlap = 50
-                chunks = []
-
-                for i in range(0, len(words), chunk_size - overlap):
-                    chunk = ' '.join(words[i:i + chunk_size])
-                    chunks.append(chunk)
-
-                logger.info(f"Split into {len(chunks)} chunks")
-
-                for i, chunk_text in enumerate(chunks):
+                client.delete(
+                    collection_name="transcripts",
+                    points_selector=models.FilterSelector(
+                        filter=models.Filter(must=[
+                            models.FieldCondition(
+                                key="source",
+                                match=models.MatchAny(any=[file_path for file_path, _, _ in prepared])
+                            )
+                        ])
+                    )
+                )
+            except Exception as delete_error:
+                # Stale chunks would remain, so don't let this run mark the files as done
+                failed_files += len(prepared)
+                _log_ingest_error("Could not remove old chunks of changed files", delete_error, logged_errors)
+        if ids:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            # On the first load into an empty collection, defer HNSW graph building and index
+            # everything once at the end. Later ingests are incremental and go into the existing
+            # graph; rebuilding it for a few changed files would cost far more than it saves
+            if initial_load:
+                client.update_collection(
+                    collection_name="transcripts",
+                    hnsw_config=models.HnswConfigDiff(m=0)
+                )
+            try:
+                for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+                    end = start + UPSERT_BATCH_SIZE
                     try:
-                        embeddings = get_embeddings(chunk_text)
-                        if embeddings is None:
-                            continue
-
-                        point_id = hash(f"{file_path}_{i}")
                         client.upsert(
                             collection_name="transcripts",
-                            points=[
-                                models.PointStruct(
-                                    id=point_id,
-                                    payload={"text": chunk_text, "source": file_path},
-                                    vector=embeddings
-                                )
-                            ]
+                            points=models.Batch(
+                                ids=ids[start:end],
+                                vectors=vectors[start:end].tolist(),
+                                payloads=payloads[start:end]
+                            ),
+                            wait=False
                         )
-                        if i % 10 == 0:
-                            logger.info(f"Processed {i}/{len(chunks)} chunks for {os.path.basename(file_path)}")
-
-                    except Exception as chunk_error:
-                        logger.error(f"Error processing chunk {i} of {file_path}: {str(chunk_error)}")
-                        logger.error(traceback.format_exc())
-                        continue
-
-            except Exception as file_error:
-                logger.error(f"Error processing file {file_path}: {str(file_error)}")
-                logger.error(traceback.format_exc())
-                continue
+                    except Exception as batch_error:
+                        failed_points += len(ids[start:end])
+                        _log_ingest_error(
+                            f"Batch {start // UPSERT_BATCH_SIZE}: {len(ids[start:end])} points failed to store",
+                            batch_error, logged_errors
+                        )
+            finally:
+                if initial_load:
+                    client.update_collection(
+                        collection_name="transcripts",
+                        hnsw_config=models.HnswConfigDiff(m=HNSW_M)
+                    )
+        logger.info(f"Stored {len(ids) - failed_points} chunks from {len(prepared)} files")
+        if failed_files or failed_points:
+            logger.warning(f"Ingest incomplete: {failed_files} files and {failed_points} points failed")
+        if ids:
+            _corpus_version += 1
+        # Failed files must be picked up again next time, so only advance on a clean run
+        if not failed_files and not failed_points:
+            set_last_ingest(cache, download_folder, ingest_started)
 
         logger.info("Completed transcript ingestion")
         return True
@@ -234,48 +491,86 @@ def ingest_transcripts(client: QdrantClient, config: Dict) -> bool:
         return False
 
 
-def generate_response(prompt: str, client: QdrantClient) -> str:
-    """Generate response using context from Qdrant and Phi model"""
-    try:
-        # Get relevant context from Qdrant
-        prompt_embedding = get_embeddings(prompt)
-        if prompt_embedding is None:
-            return "Error: Could not generate embeddings"
-
-        search_result = client.search(
-            collection_name="transcripts",
-            query_vector=prompt_embedding,
-            limit=3  # Reduced for more focused context
+def _build_prompt(prompt: str, client: QdrantClient) -> Tuple[str, List[str]]:
+    """Retrieve context from Qdrant and build the Phi prompt and its source list"""
+    # Repeat questions against an unchanged corpus skip both the embedding and the search
+    return _build_prompt_cached(prompt, client, _corpus_version)
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _build_prompt_cached(prompt: str, client: QdrantClient, corpus_version: int) -> Tuple[str, List[str]]:
+    # Get relevant context from Qdrant
+    prompt_embedding = get_embeddings(prompt)
+    if prompt_embedding is None:
+        raise ValueError("Could not generate embeddings")
+
+    # Prefetch a wider candidate pool from the quantized index, then let Qdrant
+    # rescore it and pick a diverse top 3 (MMR) in a single request
+    search_result = client.query_points(
+        collection_name="transcripts",
+        prefetch=models.Prefetch(query=prompt_embedding, limit=30),
+        query=models.NearestQuery(
+            nearest=prompt_embedding,
+            mmr=models.Mmr(diversity=0.5, candidates_limit=30)
+        ),
+        limit=3,  # Reduced for more focused context
+        search_params=models.SearchParams(
+            hnsw_ef=128,
+            quantization=models.QuantizationSearchParams(
+                rescore=True,  # Re-rank int8 candidates with original vectors
+                oversampling=2.0
+            )
         )
+    ).points
 
-        # Extract and format context with better source handling
-        context_texts = []
-        sources = set()  # Use set to avoid duplicate sources
-        for hit in search_result:
-            context_texts.append(hit.payload['text'])
-            # Extract just the filename from the full path
-            source_file = os.path.basename(hit.payload['source'])
-            if source_file:
-                sources.add(source_file)
+    # Extract and format context with better source handling
+    context_texts = []
+    sources = set()  # Use set to avoid duplicate sources
+    for hit in search_result:
+        context_texts.append(hit.payload['text'])
+        # Extract just the filename from the full path
+        source_file = os.path.basename(hit.payload['source'])
+        if source_file:
+            sources.add(source_file)
 
-        formatted_context = " ".join(context_texts)
-        source_list = list(sources)  # Convert set back to list
+    formatted_context = " ".join(context_texts)
+    source_list = list(sources)  # Convert set back to list
 
-        # Create prompt with source attribution
-        full_prompt = f"""Context: {formatted_context[:500]}...
+    # Create prompt with source attribution
+    full_prompt = f"""Context: {formatted_context[:500]}...
 
 Question: {prompt}
 
 Please provide a brief answer based on the context.
 
 Answer: """
+    return full_prompt, source_list
+
+
+def _format_sources(source_list: List[str]) -> str:
+    """Format the source attribution appended to every answer"""
+    if source_list:
+        return f"\n\nSources: {', '.join(source_list)}"
+    return "\n\nNo source documents found."
+
+
+def generate_response(prompt: str, client: QdrantClient) -> str:
+    """Generate response using context from Qdrant and Phi model"""
+    try:
+        try:
+            full_prompt, source_list = _build_prompt(prompt, client)
+        except ValueError:
+            return "Error: Could not generate embeddings"
 
         # Generate response with Phi
-        response = generate_with_phi(
-            full_prompt,
-            max_tokens=50,  # Shorter responses
-            temperature=0.1  # More focused
-        )
+        try:
+            response = generate_with_phi(
+                full_prompt,
+                max_tokens=50,  # Shorter responses
+                temperature=0.1  # More focused
+            )
+        except PhiError as e:
+            return str(e)
 
         # Clean up response
         if "Context:" in response:
@@ -286,22 +581,44 @@ Answer: """
             response = response.split("Sources:")[0]
 
         # Add source attribution with better formatting
-        response = response.strip()
-        if source_list:
-            response += f"\n\nSources: {', '.join(source_list)}"
-        else:
-            response += "\n\nNo source documents found."
-
-        return response
+        return response.strip() + _format_sources(source_list)
 
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
         logger.error(traceback.format_exc())
         return "I apologize, but I encountered an error while generating the response."
 
+
+def generate_response_stream(prompt: str, client: QdrantClient) -> Iterator[str]:
+    """Stream the Phi answer for st.write_stream, followed by its sources"""
+    try:
+        full_prompt, source_list = _build_prompt(prompt, client)
+    except ValueError:
+        yield "Error: Could not generate embeddings"
+        return
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        logger.error(traceback.format_exc())
+        yield "I apologize, but I encountered an error while generating the response."
+        return
+
+    try:
+        yield from stream_with_phi(
+            full_prompt,
+            max_tokens=50,  # Shorter responses
+            temperature=0.1  # More focused
+        )
+    except PhiError as e:
+        yield f"\n\n{e}"
+        return
+    # Sources go out only once the answer has finished streaming
+    yield _format_sources(source_list)
+
 def render(config):
     """Render the chat interface"""
     st.header("Chat with Your Transcripts")
+    if config.get('model_path'):
+        set_model_path(config['model_path'])
 
     # Test embeddings on startup
     if 'embeddings_tested' not in st.session_state:
@@ -318,14 +635,13 @@ def render(config):
         st.session_state.max_tokens = st.slider("Max Response Length", 20, 200, 50)
         st.session_state.temperature = st.slider("Temperature", 0.1, 1.0, 0.1)
 
-    # Initialize Qdrant client
-    if 'qdrant_client' not in st.session_state:
-        st.session_state.qdrant_client = setup_qdrant(config)
+    # Process-wide cached client; nothing per session to keep in session_state
+    client = setup_qdrant(config)
 
     # Ingest button
     if st.button("Ingest/Update Transcripts"):
         with st.spinner("Ingesting transcripts..."):
-            success = ingest_transcripts(st.session_state.qdrant_client, config)
+            success = ingest_transcripts(client, config)
             if success:
                 st.success("Successfully ingested transcripts!")
             else:
@@ -333,7 +649,8 @@ def render(config):
 
     # Chat interface
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        # Every rerun redraws the whole history, so keep only the most recent messages
+        st.session_state.messages = deque(maxlen=MAX_CHAT_HISTORY)
 
     # Display chat messages
     for message in st.session_state.messages:
@@ -349,6 +666,5 @@ def render(config):
 
         # Generate and display assistant response
         with st.chat_message("assistant"):
-            response = generate_response(prompt, st.session_state.qdrant_client)
-            st.markdown(response)
+            response = st.write_stream(generate_response_stream(prompt, client))
             st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
@@ -1,89 +1,401 @@
+import os
+import uuid
+import functools
+from collections import deque
+import numpy as np
 import streamlit as st
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional, Tuple
 from utils.logging_setup import logger
-from .embeddings import test_embeddings, get_embeddings
-from .llm import generate_with_phi
+from utils.embed_cache import get_embed_cache, chunk_hash
+from .embeddings import test_embeddings, get_embeddings, get_embeddings_batch, embed_model_version, set_model_path
+from .llm import generate_with_phi, stream_with_phi, PhiError, check_ollama_version, warm_phi
 from .qdrant_db import QdrantDB
 from .utils import (
-    chunk_text,
+    iter_chunks,
     get_transcript_files,
-    read_file_content,
     clean_response
 )
 
+EMBED_BATCH_SIZE = 64
+UPSERT_BATCH_SIZE = 256
+# Reading and chunking is I/O bound; tune for the disk (e.g. fewer on spinning media),
+# or per install with the 'ingest_threads' setting
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', min(8, os.cpu_count() or 1)))
+
+
+MAX_CHAT_HISTORY = 50
+# Retrieval: fetch SEARCH_LIMIT hits, keep up to MAX_CONTEXTS within SCORE_MARGIN of the best
+SEARCH_LIMIT = 20
+SCORE_MARGIN = 0.1
+MAX_CONTEXTS = 3
+CONTEXT_CHAR_BUDGET = 500
+PROMPT_CACHE_SIZE = 512
+PROMPT_TEMPLATE = """Context information: {context}...
+
+    Question: {question}
+
+    Please provide a brief answer using only the information from the context above."""
+
+
+def _build_context(texts: List[str], budget: int = CONTEXT_CHAR_BUDGET) -> str:
+    """Space-join texts up to budget characters without building the full concatenation"""
+    parts = []
+    remaining = budget
+    for text in texts:
+        if parts:
+            parts.append(' ')
+            remaining -= 1
+        parts.append(text[:remaining])
+        remaining -= len(parts[-1])
+        if remaining <= 0:
+            break
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _prompt_embedding(prompt_key: str) -> np.ndarray:
+    """Embedding of a normalized prompt; repeated questions skip the model"""
+    embedding = get_embeddings(prompt_key)
+    if embedding is None:
+        # Raising keeps the failure out of the cache so the next ask retries
+        raise ValueError("Could not generate embeddings for prompt")
+    embedding.setflags(write=False)  # Shared by every later caller
+    return embedding
+
+
+@functools.lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _search_context(db: QdrantDB, prompt_key: str) -> Tuple[Dict, ...]:
+    """Search hits for a normalized prompt, best first; cleared whenever documents are ingested"""
+    # One unthresholded search; what counts as relevant is decided relative to the best hit
+    search_results = db.search(
+        vector=_prompt_embedding(prompt_key),
+        limit=SEARCH_LIMIT,
+        score_threshold=None,
+        hnsw_ef=100
+    )
+    if not search_results:
+        # Not cached either: an empty result can also mean the search failed
+        raise LookupError(prompt_key)
+    # Qdrant returns hits best first already
+    return tuple(search_results)
+
+
+@st.cache_resource(show_spinner=False)
+def get_qdrant_db(qdrant_path: str) -> QdrantDB:
+    """Set up the Qdrant store once per process instead of on every rerun"""
+    db = QdrantDB(qdrant_path)
+    if not db.setup():
+        raise RuntimeError(f"Could not set up Qdrant at {qdrant_path}")
+    return db
+
+
+@st.cache_data(ttl=2, show_spinner=False)
+def _collection_stats(qdrant_path: str, _db: QdrantDB) -> Dict:
+    """check_status is several Qdrant round trips; reruns within a moment of each other share one"""
+    return _db.check_status()
+
+
+@st.cache_resource(show_spinner="Testing embeddings...")
+def _embeddings_ready() -> bool:
+    """Smoke-test the embedding model once per process rather than once per session"""
+    return test_embeddings()
+
+
+def _read_and_chunk(file_path: str) -> Tuple[str, List[str]]:
+    return file_path, list(iter_chunks(file_path))
+
 
 class ChatUI:
     def __init__(self, config: Dict):
         self.config = config
-        self.db = QdrantDB(config['qdrant_path'])
+        if config.get('model_path'):
+            set_model_path(config['model_path'])
+        self.db = get_qdrant_db(config['qdrant_path'])
+        self.cache_threshold = config.get('semantic_cache_threshold', 0.97)
+        self.cache = get_embed_cache(config.get('cache_path', os.path.join(os.getcwd(), 'embed_cache')))
 
     def ingest_documents(self) -> bool:
         """Ingest documents into the database"""
         try:
-            files = get_transcript_files(self.config['download_folder'])
-            logger.info(f"Found {len(files)} files to process")
-
-            for file_path in files:
-                text = read_file_content(file_path)
-                chunks = chunk_text(text)
-
-                for i, chunk in enumerate(chunks):
-                    embedding = get_embeddings(chunk)
-                    if embedding:
-                        self.db.store_embedding(
-                            text=chunk,
-                            embedding=embedding,
-                            source=file_path,
-                            point_id=hash(f"{file_path}_{i}")
-                        )
+            # Files unchanged since they were stored in this collection are not read again
+            ingested = self.db.ingested_files
+            signatures = {}  # file_path -> (mtime_ns, size) of the files read this run
+            skipped = []
+
+            def changed_files():
+                for file_path in get_transcript_files(self.config['download_folder']):
+                    try:
+                        stat = os.stat(file_path)
+                        signature = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        signature = None  # Let the worker report the error
+                    if signature is not None and ingested.get(file_path) == signature:
+                        skipped.append(file_path)
+                        continue
+                    signatures[file_path] = signature
+                    yield file_path
+
+            # Files read into a collection that already has points may have older chunks there;
+            # those go first, or chunks past the end of a now shorter file would linger
+            replace_existing = self.db.count_points() > 0
+            files = changed_files()
+            workers = int(self.config.get('ingest_threads', INGEST_WORKERS))
+
+            # Worker threads read and chunk a bounded number of files ahead while this thread
+            # embeds and stores whatever they have finished; chunks from several files share
+            # each batch. Only this thread touches the counters, Qdrant and Streamlit.
+            pending_chunks = []  # (file_path, chunk index, text)
+            pending_points = []
+            read_files = []
+            failed_files = 0
+            all_stored = True
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                in_flight = {}
+
+                def submit_next():
+                    file_path = next(files, None)
+                    if file_path is not None:
+                        in_flight[executor.submit(_read_and_chunk, file_path)] = file_path
+
+                for _ in range(workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = in_flight.pop(future)
+                        submit_next()
+                        try:
+                            _, chunks = future.result()
+                        except Exception as file_error:
+                            failed_files += 1
+                            logger.error(f"Error processing file {file_path}: {file_error}")
+                            continue
+                        if replace_existing and not self.db.delete_source(file_path):
+                            failed_files += 1
+                            continue
+                        read_files.append(file_path)
+                        pending_chunks.extend((file_path, i, chunk) for i, chunk in enumerate(chunks))
+
+                    while len(pending_chunks) >= EMBED_BATCH_SIZE:
+                        batch = pending_chunks[:EMBED_BATCH_SIZE]
+                        points = self._embed_chunks(batch)
+                        all_stored &= len(points) == len(batch)
+                        pending_points.extend(points)
+                        pending_chunks = pending_chunks[EMBED_BATCH_SIZE:]
+                        if len(pending_points) >= UPSERT_BATCH_SIZE:
+                            all_stored &= self.db.store_embeddings_bulk(pending_points)
+                            pending_points = []
 
+            # Failed files stay out of the manifest, so the next ingest retries them
+            summary = f"Read {len(read_files)} files ({failed_files} failed, {len(skipped)} unchanged)"
+            if failed_files:
+                logger.warning(summary)
+            else:
+                logger.info(summary)
+
+            if pending_chunks:
+                points = self._embed_chunks(pending_chunks)
+                all_stored &= len(points) == len(pending_chunks)
+                pending_points.extend(points)
+            if pending_points:
+                all_stored &= self.db.store_embeddings_bulk(pending_points)
+
+            # Only a run whose points all made it in may mark its files as done
+            if all_stored:
+                ingested.update((file_path, signatures[file_path]) for file_path in read_files
+                                if signatures[file_path] is not None)
+            if not read_files:
+                return True
+
+            # Cached answers and search hits were drawn from the old documents
+            self.db.clear_prompt_cache()
+            _search_context.cache_clear()
             return True
         except Exception as e:
             logger.error(f"Error ingesting documents: {e}")
             return False
 
-    def generate_response(self, prompt: str) -> str:
+    def _embed_chunks(self, chunks: List[Tuple[str, int, str]]) -> List[Dict]:
+        """Embed (file_path, chunk index, text) tuples into points for store_embeddings_bulk"""
+        # Only chunks whose content has not been embedded before go through the model
+        model_version = embed_model_version()
+        keys = [chunk_hash(chunk, model_version) for _, _, chunk in chunks]
+        embeddings = [self.cache.get(key) for key in keys]
+        # Repeated chunks (intros, outros) in the same batch are embedded once and share the row
+        missing = {}  # hash -> indices of the chunks with that content
+        for j, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[j], []).append(j)
+        if missing:
+            new_embeddings = get_embeddings_batch([chunks[indices[0]][2] for indices in missing.values()])
+            if new_embeddings is None:
+                return []
+            # The collection stores float16, so keeping more in the cache would be wasted bytes
+            new_embeddings = new_embeddings.astype(np.float16)
+            for (key, indices), embedding in zip(missing.items(), new_embeddings):  # rows are views, not copies
+                for j in indices:
+                    embeddings[j] = embedding
+                self.cache.set(key, embedding)
+
+        return [
+            {
+                'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_path}:{i}")),
+                'text': chunk,
+                'embedding': embedding,
+                'source': file_path
+            }
+            for (file_path, i, chunk), embedding in zip(chunks, embeddings)
+        ]
+
+    def _prepare_response(self, prompt: str) -> Tuple[Optional[str], Optional[np.ndarray], str, set]:
+        """
+        Embed the prompt and retrieve its context.
+
+        Returns (reply, prompt_embedding, full_prompt, sources). reply is set when the
+        answer is already known (cached, no matches, or an error) and the LLM is not needed.
+        """
+        # The uncased tokenizer ignores case and outer whitespace, so these prompts share a vector
+        prompt_key = prompt.lower().strip()
         try:
-            prompt_embedding = get_embeddings(prompt)
-            if not prompt_embedding:
-                return "Error: Could not generate embeddings for prompt"
+            prompt_embedding = _prompt_embedding(prompt_key)
+        except ValueError:
+            return "Error: Could not generate embeddings for prompt", None, "", set()
 
-            # Search with higher threshold for better matches
-            search_results = self.db.search(
-                vector=prompt_embedding,
-                limit=5,  # Get more results
-                score_threshold=0.7  # Only use high-confidence matches
-            )
+        # A near-identical earlier question can reuse its answer and skip the LLM entirely
+        if self.cache_threshold:
+            cached_response = self.db.search_prompt_cache(prompt_embedding, self.cache_threshold)
+            if cached_response is not None:
+                return cached_response, prompt_embedding, "", set()
 
-            if not search_results:
-                return "No relevant information found in the documents."
+        try:
+            search_results = _search_context(self.db, prompt_key)
+        except LookupError:
+            return "No relevant information found in the documents.", prompt_embedding, "", set()
 
-            # Sort by score and get best matches
-            search_results.sort(key=lambda x: x['score'], reverse=True)
+        # Keep the hits close to the best one
+        cutoff = search_results[0]['score'] - SCORE_MARGIN
+        search_results = [result for result in search_results if result['score'] >= cutoff][:MAX_CONTEXTS]
 
-            # Use only the most relevant contexts
-            context_texts = [result['text'] for result in search_results[:3]]
-            sources = {os.path.basename(result['source'])
-                       for result in search_results[:3]}
+        context_texts = [result['text'] for result in search_results]
+        sources = {os.path.basename(result['source'])
+                   for result in search_results}
 
-            full_prompt = f"""Context information: {' '.join(context_texts)[:500]}...
+        full_prompt = PROMPT_TEMPLATE.format(context=_build_context(context_texts), question=prompt)
+        return None, prompt_embedding, full_prompt, sources
 
-    Question: {prompt}
+    def _finish_response(self, prompt: str, prompt_embedding: np.ndarray, response: str, sources: set) -> str:
+        """Clean the model output, attach sources and remember it in the prompt cache"""
+        cleaned_response = clean_response(response)
+        if not cleaned_response:
+            # Nothing worth keeping; don't let the cache serve an empty answer
+            return "No response generated"
+        if sources:
+            cleaned_response += f"\n\nSources: {', '.join(sources)}"
 
-    Please provide a brief answer using only the information from the context above."""
+        if self.cache_threshold:
+            self.db.store_prompt_cache(prompt_embedding, prompt, cleaned_response)
+        return cleaned_response
 
-            response = generate_with_phi(
-                full_prompt,
-                max_tokens=50,
-                temperature=0.1
-            )
+    def generate_response(self, prompt: str) -> str:
+        try:
+            reply, prompt_embedding, full_prompt, sources = self._prepare_response(prompt)
+            if reply is not None:
+                return reply
 
-            cleaned_response = clean_response(response)
-            if sources:
-                cleaned_response += f"\n\nSources: {', '.join(sources)}"
+            try:
+                response = generate_with_phi(
+                    full_prompt,
+                    max_tokens=50,
+                    temperature=0.1
+                )
+            except PhiError as e:
+                return str(e)  # Not cached
 
-            return cleaned_response
+            return self._finish_response(prompt, prompt_embedding, response, sources)
 
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return "An error occurred while generating the response."
\ No newline at end of file
+            return "An error occurred while generating the response."
+
+    def generate_response_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Like generate_response, but yields the cleaned answer so far each time the model
+        produces more. Every value replaces the previous one; the last is the full reply.
+        """
+        try:
+            reply, prompt_embedding, full_prompt, sources = self._prepare_response(prompt)
+            if reply is not None:
+                yield reply
+                return
+
+            response = ""
+            try:
+                for piece in stream_with_phi(full_prompt, max_tokens=50, temperature=0.1):
+                    response += piece
+                    # clean_response may drop everything before a late prefix, so the whole
+                    # text is cleaned again rather than just the new piece
+                    yield clean_response(response)
+            except PhiError as e:
+                # The partial answer is replaced by the error and nothing is cached
+                yield str(e)
+                return
+
+            # Only an answer Ollama finished is cached, exactly as it is shown, sources included
+            yield self._finish_response(prompt, prompt_embedding, response, sources)
+
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            yield "An error occurred while generating the response."
+
+    def render(self):
+        """Render the chat interface"""
+        st.header("Chat with Your Transcripts")
+
+        if not _embeddings_ready():
+            # Don't keep the failure cached; the next rerun tries again
+            _embeddings_ready.clear()
+            st.error("Error: Embeddings system not working properly")
+            return
+
+        if check_ollama_version() is None:
+            st.warning("Ollama is not reachable at localhost:11434. Answers will fail until it is running.")
+        else:
+            warm_phi()
+
+        # Ingest button
+        if st.button("Ingest/Update Transcripts"):
+            with st.spinner("Ingesting transcripts..."):
+                if self.ingest_documents():
+                    _collection_stats.clear()
+                    st.success("Successfully ingested transcripts!")
+                else:
+                    st.error("Failed to ingest transcripts. Check logs for details.")
+
+        with st.sidebar:
+            stats = _collection_stats(self.config['qdrant_path'], self.db)
+            if stats['status'] == 'ok':
+                st.caption(f"Indexed chunks: {stats['points_count'].count}")
+            else:
+                st.caption(f"Qdrant status: {stats['error']}")
+
+        # Chat interface; every rerun redraws the history, so keep only recent messages
+        if "messages" not in st.session_state:
+            st.session_state.messages = deque(maxlen=MAX_CHAT_HISTORY)
+
+        for message in st.session_state.messages:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+        if prompt := st.chat_input("Ask about your transcripts"):
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.markdown(prompt)
+
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                response = ""
+                for response in self.generate_response_stream(prompt):
+                    placeholder.markdown(response)
+                st.session_state.messages.append({"role": "assistant", "content": response})
@@ -1,38 +1,150 @@
+import os
+import numpy as np
+import streamlit as st
 import torch
+import traceback
 from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
 from typing import List, Optional
 from utils.logging_setup import logger
 
-MINILM_MODEL = None
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+MINILM_MODEL_ID = 'sentence-transformers/all-MiniLM-L6-v2'
+MINILM_MAX_SEQ_LENGTH = 256
+ONNX_MODEL_SUBDIR = "minilm_onnx"
+ONNX_MODEL_FILE = "model_int8.onnx"
+# One core stays free for Streamlit and the ingest readers; a model this small stops
+# scaling past about 8 threads and more only adds contention with the BLAS pool
+INFERENCE_THREADS = max(1, min(8, (os.cpu_count() or 2) - 1))
 
+# The 'model_path' setting; the chat modules set it from their config before embedding anything
+_model_path = os.path.join(os.getcwd(), "models")
+
+# Loaded once per process and shared by every session, without racing concurrent first loads
+@st.cache_resource(show_spinner=False)
 def get_minilm_model():
-    global MINILM_MODEL
-    if MINILM_MODEL is None:
-        MINILM_MODEL = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    return MINILM_MODEL
+    model = SentenceTransformer(MINILM_MODEL_ID, device=DEVICE)
+    if DEVICE == "cuda":
+        model.half()  # Halves activation bandwidth; embeddings are normalized anyway
+    else:
+        torch.set_num_threads(INFERENCE_THREADS)
+    # Inference only: no dropout and no autograd bookkeeping on the weights
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    logger.info(f"Model loaded successfully on {DEVICE}")
+    return model
+
+
+@st.cache_resource(show_spinner=False)
+def get_minilm_tokenizer():
+    # chat.py chunks by offset mapping, which only the Rust tokenizers provide
+    tokenizer = AutoTokenizer.from_pretrained(MINILM_MODEL_ID, use_fast=True)
+    if not tokenizer.is_fast:
+        raise RuntimeError(f"A fast tokenizer is required for {MINILM_MODEL_ID}")
+    return tokenizer
+
+
+def set_model_path(model_path: str) -> None:
+    """Keep exported model files under the configured model_path"""
+    global _model_path
+    _model_path = model_path
+
 
+def export_minilm_onnx(output_dir: str) -> str:
+    """One-time export of MiniLM to ONNX with dynamic INT8 weight quantization"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logger.info(f"Exporting MiniLM to ONNX in {output_dir}")
+    ORTModelForFeatureExtraction.from_pretrained(MINILM_MODEL_ID, export=True).save_pretrained(output_dir)
+
+    quantized_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    quantize_dynamic(os.path.join(output_dir, "model.onnx"), quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def get_onnx_session():
+    """INT8 ONNX Runtime session for CPU inference, or None to fall back to sentence-transformers"""
+    if DEVICE != "cpu":
+        return None
+    return _load_onnx_session(os.path.join(_model_path, ONNX_MODEL_SUBDIR))
 
-def get_embeddings(text: str) -> Optional[List[float]]:
+
+@st.cache_resource(show_spinner="Loading the embedding model...")
+def _load_onnx_session(model_dir: str):
     try:
-        model = get_minilm_model()
+        import onnxruntime as ort
+
+        model_file = os.path.join(model_dir, ONNX_MODEL_FILE)
+        if not os.path.exists(model_file):
+            # Downloads the weights and converts them; only the first start pays for this
+            logger.info(f"No ONNX MiniLM in {model_dir} yet; exporting it once, this can take a few minutes")
+            export_minilm_onnx(model_dir)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = INFERENCE_THREADS
+        # A single encoder graph has no independent branches worth a second pool
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # Fuses LayerNorm/GELU/attention; stated so a changed ORT default can't slip through
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        logger.info(f"Using ONNX Runtime MiniLM from {model_file}")
+        return session
+    except Exception as e:
+        logger.warning(f"ONNX Runtime unavailable, using sentence-transformers MiniLM: {str(e)}")
+        return None
+
+
+def embed_model_version() -> str:
+    """Cache tag for vectors from the active backend; int8 and fp16 vectors differ slightly from fp32"""
+    if get_onnx_session() is not None:
+        return f"{MINILM_MODEL_ID}:onnx-int8:cpu"
+    return f"{MINILM_MODEL_ID}:sentence-transformers:{DEVICE}"
+
+
+def onnx_embed_ids(session, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Mean-pooled, L2-normalized embeddings for a batch of token ids, matching sentence-transformers"""
+    feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+    if any(i.name == 'token_type_ids' for i in session.get_inputs()):
+        feeds['token_type_ids'] = np.zeros_like(input_ids)
+    hidden = session.run(None, feeds)[0]
+
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    return (pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)).astype(np.float32)
 
-        # Normalize input text
-        text = text.lower().strip()
 
-        with torch.no_grad():
+def _onnx_encode(session, texts: List[str]) -> np.ndarray:
+    inputs = get_minilm_tokenizer()(
+        texts, padding=True, truncation=True, max_length=MINILM_MAX_SEQ_LENGTH, return_tensors='np'
+    )
+    return onnx_embed_ids(session, inputs['input_ids'], inputs['attention_mask'])
+
+
+def get_embeddings(text: str) -> Optional[np.ndarray]:
+    try:
+        # No lower()/strip() here: the uncased MiniLM tokenizer already ignores both
+        session = get_onnx_session()
+        if session is not None:
+            embeddings = _onnx_encode(session, [text])[0]
+            logger.debug(f"Generated embeddings of length: {len(embeddings)}")
+            return embeddings
+
+        model = get_minilm_model()
+        with torch.inference_mode():
             # Get embeddings with mean pooling
             embeddings = model.encode(
                 text,
-                convert_to_tensor=True,
+                convert_to_numpy=True,
                 show_progress_bar=False,
-                normalize_embeddings=True  # Important for cosine similarity
+                normalize_embeddings=True  # Required: the collection scores by dot product
             )
 
-            # Convert to list format
-            if isinstance(embeddings, torch.Tensor):
-                embeddings = embeddings.cpu().numpy().tolist()
+            # float32 array rather than a list of 384 Python floats
+            embeddings = np.asarray(embeddings, dtype=np.float32)
 
-            logger.info(f"Generated embeddings of length: {len(embeddings)}")
+            logger.debug(f"Generated embeddings of length: {len(embeddings)}")
             return embeddings
 
     except Exception as e:
@@ -40,11 +152,41 @@ def get_embeddings(text: str) -> Optional[List[float]]:
         logger.error(traceback.format_exc())
         return None
 
+def get_embeddings_batch(texts: List[str], batch_size: int = 64) -> Optional[np.ndarray]:
+    """Embed many texts in one encode call; row i matches get_embeddings(texts[i])"""
+    try:
+        session = get_onnx_session()
+        if session is not None:
+            # Similar lengths share a batch so little of it is padding, as encode() does
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+            embeddings = np.empty((len(texts), 384), dtype=np.float32)
+            for start in range(0, len(texts), batch_size):
+                batch = order[start:start + batch_size]
+                embeddings[batch] = _onnx_encode(session, [texts[i] for i in batch])
+            logger.debug(f"Generated {len(embeddings)} embeddings")
+            return embeddings
+
+        model = get_minilm_model()
+        with torch.inference_mode():
+            embeddings = model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                normalize_embeddings=True  # Required: the collection scores by dot product
+            )
+
+        logger.debug(f"Generated {len(embeddings)} embeddings")
+        return np.asarray(embeddings, dtype=np.float32)
+
+    except Exception as e:
+        logger.error(f"Error getting batch embeddings: {str(e)}")
+        logger.error(traceback.format_exc())
+        return None
+
 def test_embeddings() -> bool:
     try:
         logger.info("Starting embeddings test...")
-        model = get_minilm_model()
-        logger.info("Model loaded successfully")
         test_text = "This is a test sentence."
         embeddings = get_embeddings(test_text)
         if embeddings is not None:
@@ -1,8 +1,80 @@
+import os
 import requests
+import threading
+from requests.adapters import HTTPAdapter
 import traceback
-from typing import Optional
+import streamlit as st
+import json
+from typing import Iterator, Optional
 from utils.logging_setup import logger
 
+PHI_ERROR_MESSAGES = {
+    408: "Request timed out. Try a shorter prompt.",
+    500: "Server error. The model might be overloaded.",
+    503: "Service unavailable. Please try again in a moment."
+}
+TIMEOUT_MESSAGE = "The request took too long to process. Please try again."
+CONNECTION_MESSAGE = "Could not connect to the model service. Is it running?"
+OLLAMA_GENERATE_URL = "http://localhost:11434/api/generate"
+OLLAMA_VERSION_URL = "http://localhost:11434/api/version"
+PHI_MODEL = "phi3:3.8b"
+# How long Ollama keeps the model loaded after a request; reloading it costs seconds
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Keep-alive connections to Ollama, shared by the status check, warm-up and generation calls
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+
+class PhiError(Exception):
+    """Raised by generate_with_phi and stream_with_phi instead of an answer; the message is fit to show"""
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def check_ollama_version() -> Optional[str]:
+    """Ollama's version, or None if it is not reachable; cached briefly so reruns don't block"""
+    try:
+        # Ollama runs on localhost, so anything slower than this means it is down
+        response = _SESSION.get(OLLAMA_VERSION_URL, timeout=0.5)
+        if response.status_code == 200:
+            return response.json().get('version')
+        logger.warning(f"Ollama version check returned {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Ollama not reachable: {str(e)}")
+    return None
+
+
+@st.cache_resource(show_spinner=False)
+def warm_phi() -> None:
+    """Have Ollama load the model in the background so the first question doesn't wait for it"""
+    def load():
+        try:
+            # An empty prompt only loads the model
+            _SESSION.post(
+                OLLAMA_GENERATE_URL,
+                json={"model": PHI_MODEL, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE},
+                timeout=120
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not preload {PHI_MODEL}: {str(e)}")
+
+    threading.Thread(target=load, daemon=True).start()
+
+
+def _phi_payload(prompt: str, max_tokens: int, temperature: float, stream: bool) -> dict:
+    return {
+        "model": PHI_MODEL,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {
+            "temperature": temperature,
+            "num_predict": max_tokens,
+            "num_ctx": 512,
+            "num_thread": 4
+        }
+    }
+
 
 def generate_with_phi(
         prompt: str,
@@ -10,40 +82,81 @@ def generate_with_phi(
         temperature: float = 0.7,
         timeout: int = 90
 ) -> str:
+    """The complete Phi response; raises PhiError if there is none"""
     try:
-        url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": "phi3:3.8b",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": temperature,
-                "num_predict": max_tokens,
-                "num_ctx": 512,
-                "num_thread": 4
-            }
-        }
+        payload = _phi_payload(prompt, max_tokens, temperature, stream=False)
 
-        response = requests.post(url, json=payload, timeout=timeout)
+        response = _SESSION.post(OLLAMA_GENERATE_URL, json=payload, timeout=timeout)
 
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('response', 'No response generated')
+        if response.status_code != 200:
+            raise PhiError(PHI_ERROR_MESSAGES.get(response.status_code, f"Error {response.status_code} from API"))
 
-        error_messages = {
-            408: "Request timed out. Try a shorter prompt.",
-            500: "Server error. The model might be overloaded.",
-            503: "Service unavailable. Please try again in a moment."
-        }
-        return error_messages.get(response.status_code, f"Error {response.status_code} from API")
+        result = response.json()
+        if result.get('error'):
+            logger.error(f"Ollama reported an error: {result['error']}")
+            raise PhiError(f"Error: {result['error']}")
+        if 'response' not in result:
+            raise PhiError("No response generated")
+        return result['response']
 
-    except requests.exceptions.Timeout:
+    except PhiError:
+        raise
+    except requests.exceptions.Timeout as e:
         logger.error("Request timed out")
-        return "The request took too long to process. Please try again."
-    except requests.exceptions.ConnectionError:
+        raise PhiError(TIMEOUT_MESSAGE) from e
+    except requests.exceptions.ConnectionError as e:
         logger.error("Connection failed")
-        return "Could not connect to the model service. Is it running?"
+        raise PhiError(CONNECTION_MESSAGE) from e
     except Exception as e:
         logger.error(f"Error generating with Phi: {str(e)}")
         logger.error(traceback.format_exc())
-        return f"Error: {str(e)}"
\ No newline at end of file
+        raise PhiError(f"Error: {str(e)}") from e
+
+
+def stream_with_phi(
+        prompt: str,
+        max_tokens: int = 150,
+        temperature: float = 0.7,
+        timeout: int = 90
+) -> Iterator[str]:
+    """
+    Yield the Phi response piece by piece as Ollama streams it.
+
+    Raises PhiError if the request fails or Ollama stops before its final "done" line,
+    including after some pieces have already been yielded.
+    """
+    try:
+        payload = _phi_payload(prompt, max_tokens, temperature, stream=True)
+
+        with _SESSION.post(OLLAMA_GENERATE_URL, json=payload, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                raise PhiError(PHI_ERROR_MESSAGES.get(response.status_code, f"Error {response.status_code} from API"))
+
+            # Ollama sends one JSON object per line until one with "done": true
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    logger.error(f"Ollama reported an error: {chunk['error']}")
+                    raise PhiError(f"Error: {chunk['error']}")
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done'):
+                    return
+
+        logger.error("Ollama closed the stream before it was done")
+        raise PhiError("Error: The model stopped before finishing its answer.")
+
+    except PhiError:
+        raise
+    except requests.exceptions.Timeout as e:
+        logger.error("Request timed out")
+        raise PhiError(TIMEOUT_MESSAGE) from e
+    except requests.exceptions.ConnectionError as e:
+        logger.error("Connection failed")
+        raise PhiError(CONNECTION_MESSAGE) from e
+    except Exception as e:
+        logger.error(f"Error streaming from Phi: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise PhiError(f"Error: {str(e)}") from e
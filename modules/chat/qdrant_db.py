@@ -1,15 +1,20 @@
 import os
-from typing import Dict, List, Optional
+import logging
+import uuid
+from typing import Dict, List, Optional, Tuple
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from utils.logging_setup import logger
 import traceback
+import numpy as np
 
 
 class QdrantDB:
     def __init__(self, path: str):
         self.path = path
         self.client = None
+        # (mtime_ns, size) of each transcript file stored in the collection, by path
+        self.ingested_files: Dict[str, Tuple[int, int]] = {}
 
     def setup(self) -> bool:
         try:
@@ -21,28 +26,43 @@ class QdrantDB:
                 os.remove(lock_file)
                 logger.info("Removed existing Qdrant lock file")
 
-            # Set permissions
-            os.chmod(self.path, 0o777)
-            for root, dirs, files in os.walk(self.path):
-                for d in dirs:
-                    os.chmod(os.path.join(root, d), 0o777)
-                for f in files:
-                    os.chmod(os.path.join(root, f), 0o666)
-
-            self.client = QdrantClient(path=self.path)
-            self.client.recreate_collection(
-                collection_name="transcripts",
+            # One instance serves every session, whose reruns happen on different threads
+            self.client = QdrantClient(path=self.path, force_disable_check_same_thread=True)
+            self._recreate_collection(
+                "transcripts",
                 vectors_config=models.VectorParams(
                     size=384,
-                    distance=models.Distance.COSINE
+                    distance=models.Distance.DOT,  # Embeddings are normalized, so dot == cosine
+                    datatype=models.Datatype.FLOAT16,  # Half the bytes per vector; queries stay float32
+                    on_disk=True  # Originals stay on disk, quantized copies live in RAM
+                ),
+                hnsw_config=models.HnswConfigDiff(m=24, ef_construct=128),  # Denser graph for better recall
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True
+                    )
                 )
             )
+            self.ingested_files = {}  # The collection starts out empty
+            # Answers cached against the old collection would be stale
+            self._recreate_collection(
+                "prompt_cache",
+                vectors_config=models.VectorParams(size=384, distance=models.Distance.DOT)
+            )
             return True
         except Exception as e:
             logger.error(f"Error setting up Qdrant: {str(e)}")
             logger.error(traceback.format_exc())
             return False
 
+    def _recreate_collection(self, collection_name: str, **config) -> None:
+        """Drop collection_name if it exists and create it empty with config"""
+        if self.client.collection_exists(collection_name):
+            self.client.delete_collection(collection_name)
+        self.client.create_collection(collection_name=collection_name, **config)
+
     def check_status(self) -> Dict:
         try:
             collection_info = self.client.get_collection('transcripts')
@@ -65,16 +85,16 @@ class QdrantDB:
     def store_embedding(
             self,
             text: str,
-            embedding: List[float],
+            embedding: np.ndarray,
             source: str,
-            point_id: Optional[int] = None
+            point_id: Optional[str] = None
     ) -> bool:
         try:
             self.client.upsert(
                 collection_name="transcripts",
                 points=[
                     models.PointStruct(
-                        id=point_id or hash(f"{source}_{text[:50]}"),
+                        id=point_id or str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}:{text[:50]}")),
                         payload={"text": text, "source": source},
                         vector=embedding
                     )
@@ -85,27 +105,132 @@ class QdrantDB:
             logger.error(f"Error storing embedding: {str(e)}")
             return False
 
-    def search(self, vector: List[float], limit: int = 3, score_threshold: float = 0.7) -> List[Dict]:
+    def store_embeddings_bulk(self, points: List[Dict]) -> bool:
+        """
+        Store many embeddings in a single upsert
+
+        Args:
+            points: Dicts with 'id', 'text', 'embedding' and 'source' keys
+        """
+        try:
+            # Column-wise batch: the vectors go over as one float32 matrix, not per-point lists
+            self.client.upsert(
+                collection_name="transcripts",
+                points=models.Batch(
+                    ids=[point['id'] for point in points],
+                    # Cached embeddings are float16; the client sends float32 either way
+                    vectors=np.asarray([point['embedding'] for point in points], dtype=np.float32),
+                    payloads=[{"text": point['text'], "source": point['source']} for point in points]
+                ),
+                wait=False  # Let Qdrant index while the next batch is being embedded
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error storing {len(points)} embeddings: {str(e)}")
+            return False
+
+    def delete_source(self, source: str) -> bool:
+        """Remove every chunk stored for source, e.g. before storing a changed file again"""
+        try:
+            self.client.delete(
+                collection_name="transcripts",
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(
+                        must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))]
+                    )
+                )
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting chunks of {source}: {str(e)}")
+            return False
+
+    def count_points(self) -> int:
+        """Number of chunks in the transcripts collection"""
+        return self.client.count('transcripts').count
+
+    def search_prompt_cache(self, vector: np.ndarray, threshold: float) -> Optional[str]:
+        """Return the cached response of a previous prompt at least threshold similar, if any"""
+        try:
+            results = self.client.query_points(
+                collection_name="prompt_cache",
+                query=vector,
+                limit=1,
+                score_threshold=threshold,
+                with_payload=['response']  # The cached prompt text is not needed
+            ).points
+            return results[0].payload['response'] if results else None
+        except Exception as e:
+            logger.error(f"Error searching prompt cache: {str(e)}")
+            return None
+
+    def store_prompt_cache(self, vector: np.ndarray, prompt: str, response: str) -> bool:
+        try:
+            self.client.upsert(
+                collection_name="prompt_cache",
+                points=[
+                    models.PointStruct(
+                        id=str(uuid.uuid5(uuid.NAMESPACE_URL, prompt)),
+                        payload={"prompt": prompt, "response": response},
+                        vector=vector
+                    )
+                ]
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error storing prompt cache: {str(e)}")
+            return False
+
+    def clear_prompt_cache(self) -> bool:
+        """Drop cached responses, e.g. after new documents change what the answers would be"""
+        try:
+            self.client.delete(
+                collection_name="prompt_cache",
+                points_selector=models.FilterSelector(filter=models.Filter())
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error clearing prompt cache: {str(e)}")
+            return False
+
+    def search(
+            self,
+            vector: np.ndarray,
+            limit: int = 3,
+            score_threshold: Optional[float] = 0.7,
+            hnsw_ef: Optional[int] = None
+    ) -> List[Dict]:
         """
         Search for similar documents in Qdrant
 
         Args:
             vector: Query vector
             limit: Number of results to return
-            score_threshold: Minimum similarity score (0 to 1)
+            score_threshold: Minimum similarity score (0 to 1), or None for no minimum
+            hnsw_ef: HNSW candidate list size at search time (None for Qdrant's default)
         """
         try:
-            results = self.client.search(
+            results = self.client.query_points(
                 collection_name="transcripts",
-                query_vector=vector,
+                query=vector,
                 limit=limit,
-                score_threshold=score_threshold  # Only return results above this similarity
-            )
+                score_threshold=score_threshold,  # Only return results above this similarity
+                with_payload=['text', 'source'],  # Only the fields read below
+                with_vectors=False,
+                search_params=models.SearchParams(
+                    hnsw_ef=hnsw_ef,
+                    quantization=models.QuantizationSearchParams(
+                        rescore=True,  # Re-rank int8 candidates with original vectors
+                        oversampling=2.0
+                    )
+                )
+            ).points
 
-            # Log search results for debugging
+            # Log search results for debugging; skip building previews unless they are shown
             logger.info(f"Search returned {len(results)} results")
-            for hit in results:
-                logger.info(f"Score: {hit.score}, Text preview: {hit.payload['text'][:100]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                for hit in results:
+                    logger.debug(f"Score: {hit.score}, Text preview: {hit.payload['text'][:100]}...")
 
             return [
                 {
@@ -114,7 +239,7 @@ class QdrantDB:
                     'score': hit.score
                 }
                 for hit in results
-                if hit.score > score_threshold  # Double check scores
+                if score_threshold is None or hit.score > score_threshold  # Double check scores
             ]
         except Exception as e:
             logger.error(f"Error searching: {str(e)}")
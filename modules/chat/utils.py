@@ -1,22 +1,81 @@
 import os
-from typing import List, Dict
-import glob
+import re
+from collections import deque
+from typing import Iterator, List, Dict
 from utils.logging_setup import logger
 
+WORD_RE = re.compile(r'\S+')
+READ_BLOCK_SIZE = 256 * 1024
+
 
 def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]:
-    """Split text into overlapping chunks"""
-    words = text.split()
+    """Split text into overlapping chunks of words, sliced straight from the original text"""
+    # Word spans only; no word list or re-joined copies of the text
+    offsets = [(match.start(), match.end()) for match in WORD_RE.finditer(text)]
     chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
+    for i in range(0, len(offsets), chunk_size - overlap):
+        last = min(i + chunk_size, len(offsets)) - 1
+        chunks.append(text[offsets[i][0]:offsets[last][1]])
     return chunks
 
 
-def get_transcript_files(directory: str) -> List[str]:
-    """Get all .txt files recursively from directory"""
-    return glob.glob(os.path.join(directory, '**/*.txt'), recursive=True)
+def iter_chunks(file_path: str, chunk_size: int = 300, overlap: int = 50) -> Iterator[str]:
+    """
+    Yield the same chunks as chunk_text(read_file_content(file_path)), reading the file
+    in blocks so only one block and one window of words are held in memory at a time.
+    Read and decode errors propagate, so a partly read file is never taken as complete.
+    """
+    step = chunk_size - overlap
+    window = deque()  # [word, whitespace that follows it]
+    with open(file_path, 'r', encoding='utf-8') as f:
+        gap = ''
+        carry = ''
+        while True:
+            # Fixed-size reads: transcripts are often a single very long line
+            block = f.read(READ_BLOCK_SIZE)
+            text = carry + block
+            end = len(text)
+            if block:
+                # A word running to the end of the block may continue in the next one
+                while end and not text[end - 1].isspace():
+                    end -= 1
+            carry = text[end:]
+
+            pos = 0
+            for match in WORD_RE.finditer(text, 0, end):
+                if window:
+                    window[-1][1] = gap + text[pos:match.start()]
+                gap = ''
+                window.append([match.group(), ''])
+                pos = match.end()
+                if len(window) == chunk_size:
+                    yield _join_window(window)
+                    for _ in range(step):
+                        window.popleft()
+            gap += text[pos:end]
+            if not block:
+                break
+
+    # chunk_text also starts a (shorter) chunk at every remaining step before the end
+    while window:
+        yield _join_window(window)
+        for _ in range(min(step, len(window))):
+            window.popleft()
+
+
+def _join_window(window: deque) -> str:
+    last = len(window) - 1
+    return ''.join(word if i == last else word + space for i, (word, space) in enumerate(window))
+
+
+def get_transcript_files(directory: str) -> Iterator[str]:
+    """Yield all .txt files recursively from directory as the tree is walked"""
+    for dirpath, dirnames, filenames in os.walk(directory):
+        # Match glob's '**', which does not descend into hidden directories
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.endswith('.txt') and not filename.startswith('.'):
+                yield os.path.join(dirpath, filename)
 
 
 def read_file_content(file_path: str) -> str:
@@ -6,9 +6,10 @@ from utils.logging_setup import logger
 from utils.common import (
     create_folder,
     sanitize_filename,
-    fetch_transcript,
+    fetch_transcript_or_error,
     save_transcript_to_text,
-    get_video_id_from_url
+    get_video_id_from_url,
+    MAX_TRANSCRIPT_WORKERS
 )
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -17,6 +18,7 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import os
 
@@ -228,12 +230,11 @@ def get_playlist_info_selenium(playlist_url):
         return None, None
 
 
-def process_playlist_video(video_data, folder_name):
-    """Process a single video from the playlist."""
+def save_playlist_video(video_data, transcript, folder_name):
+    """Save the fetched transcript of a single video from the playlist."""
     try:
         logger.info(f"Processing video: {video_data['title']}")
 
-        transcript = fetch_transcript(video_data['url'])
         if transcript:
             save_path = save_transcript_to_text(
                 transcript,
@@ -288,29 +289,39 @@ def render(config):
                 progress_bar = st.progress(0)
                 status_table = st.empty()
 
-                for i, video_data in enumerate(videos_data):
-                    try:
-                        success, message = process_playlist_video(video_data, folder_name)
-
-                        status_data.append({
-                            'Title': video_data['title'],
-                            'Status': '✅' if success else '❌',
-                            'Message': message
-                        })
-
-                        progress_bar.progress((i + 1) / len(videos_data))
+                # Transcript requests are network-bound and independent, so fetch them
+                # concurrently; errors are reported and files saved here on the script thread
+                with ThreadPoolExecutor(max_workers=MAX_TRANSCRIPT_WORKERS) as executor:
+                    futures = {
+                        executor.submit(fetch_transcript_or_error, video_data['url']): video_data
+                        for video_data in videos_data
+                    }
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        video_data = futures[future]
+                        try:
+                            transcript, error = future.result()
+                            if error:
+                                st.error(error)
+                            success, message = save_playlist_video(video_data, transcript, folder_name)
+
+                            status_data.append({
+                                'Title': video_data['title'],
+                                'Status': '✅' if success else '❌',
+                                'Message': message
+                            })
+
+                        except Exception as e:
+                            logger.error(f"Error processing video {video_data['title']}: {str(e)}")
+                            status_data.append({
+                                'Title': video_data['title'],
+                                'Status': '❌',
+                                'Message': f"Error: {str(e)}"
+                            })
+
+                        progress_bar.progress(done / len(videos_data))
                         df = pd.DataFrame(status_data)
                         status_table.dataframe(df)
 
-                    except Exception as e:
-                        logger.error(f"Error processing video {video_data['title']}: {str(e)}")
-                        status_data.append({
-                            'Title': video_data['title'],
-                            'Status': '❌',
-                            'Message': f"Error: {str(e)}"
-                        })
-                        continue
-
                 successful = sum(1 for s in status_data if s['Status'] == '✅')
                 st.success(
                     f"Processed {len(videos_data)} videos. Successfully downloaded {successful} transcripts to {folder_name}")
@@ -9,6 +9,9 @@ from googletrans import Translator
 import streamlit as st
 from .logging_setup import logger
 
+# Concurrent transcript downloads; kept small to stay clear of YouTube rate limits
+MAX_TRANSCRIPT_WORKERS = 8
+
 
 def create_folder(folder_name):
     if not os.path.exists(folder_name):
@@ -62,11 +65,16 @@ def get_video_title(video_url):
         return get_video_title_selenium(video_url)
 
 
-def fetch_transcript(video_url):
-    """Fetch transcript for a video with language fallback."""
+def fetch_transcript_or_error(video_url):
+    """
+    Fetch transcript for a video with language fallback.
+
+    Returns (transcript, error); error is a message for the user when the transcript could
+    not be fetched. Makes no Streamlit calls, so it is safe to run in a worker thread.
+    """
     video_id = get_video_id_from_url(video_url)
     if video_id is None:
-        return None
+        return None, None
 
     translator = Translator()
     try:
@@ -74,7 +82,7 @@ def fetch_transcript(video_url):
         try:
             transcript = transcript_list.find_transcript(['en']).fetch()
             logger.info(f"Fetched English transcript for video {video_id}")
-            return ' '.join([entry['text'] for entry in transcript])
+            return ' '.join([entry['text'] for entry in transcript]), None
         except NoTranscriptFound:
             logger.warning(f"No English transcript found for video {video_id}")
             try:
@@ -82,14 +90,23 @@ def fetch_transcript(video_url):
                 translated_text = ' '.join(
                     [translator.translate(entry['text'], src='pt', dest='en').text for entry in pt_transcript])
                 logger.info(f"Translated Portuguese transcript for video {video_id}")
-                return translated_text
+                return translated_text, None
             except Exception as e:
-                logger.error(f"Failed to fetch or translate Portuguese transcript for video {video_id}: {str(e)}")
-                st.error(f"Failed to fetch or translate Portuguese transcript for video {video_id}: {str(e)}")
+                error = f"Failed to fetch or translate Portuguese transcript for video {video_id}: {str(e)}"
+                logger.error(error)
+                return None, error
     except Exception as e:
-        logger.error(f"Unable to fetch any transcripts for video {video_id}: {str(e)}")
-        st.error(f"Unable to fetch any transcripts for video {video_id}: {str(e)}")
-        return None
+        error = f"Unable to fetch any transcripts for video {video_id}: {str(e)}"
+        logger.error(error)
+        return None, error
+
+
+def fetch_transcript(video_url):
+    """Fetch transcript for a video with language fallback, reporting failures in the page."""
+    transcript, error = fetch_transcript_or_error(video_url)
+    if error:
+        st.error(error)
+    return transcript
 
 
 def save_transcript_to_text(transcript, filename, folder):
@@ -0,0 +1,51 @@
+import os
+import hashlib
+from typing import List, Optional
+from diskcache import Cache
+from .logging_setup import logger
+
+_caches = {}
+
+
+def get_embed_cache(cache_path):
+    """Open (once per process) the on-disk embedding cache at cache_path."""
+    if cache_path not in _caches:
+        os.makedirs(cache_path, exist_ok=True)
+        logger.info(f"Opening embedding cache at {cache_path}")
+        _caches[cache_path] = Cache(cache_path)
+    return _caches[cache_path]
+
+
+def chunk_hash(text, model_version=''):
+    """Stable content key for a chunk of text as embedded by model_version."""
+    digest = hashlib.blake2b(model_version.encode('utf-8') + b'\0', digest_size=16)
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime, stat.st_size
+
+
+def get_file_chunks(cache, file_path) -> Optional[List[str]]:
+    """Return the chunk texts recorded for file_path if the file is unchanged since then."""
+    entry = cache.get(f"file:{file_path}")
+    if entry is None or entry['signature'] != _file_signature(file_path):
+        return None
+    return entry['chunks']
+
+
+def set_file_chunks(cache, file_path, chunks):
+    """Remember the chunk texts of file_path, keyed by its current mtime and size."""
+    cache.set(f"file:{file_path}", {'signature': _file_signature(file_path), 'chunks': chunks})
+
+
+def get_last_ingest(cache, folder) -> float:
+    """Start time of the last complete ingest of folder, or 0 if there was none."""
+    return cache.get(f"last_ingest:{folder}", 0.0)
+
+
+def set_last_ingest(cache, folder, timestamp):
+    """Record that every transcript in folder modified before timestamp is stored."""
+    cache.set(f"last_ingest:{folder}", timestamp)